@@ -1,17 +1,21 @@
 import asyncio
 import re, sys
+from functools import lru_cache
 from datetime import datetime
-from statistics import mean
 
 import httpx
+import numpy as np
 from openpyxl import Workbook, load_workbook
-from playwright.async_api import async_playwright, TimeoutError as PWTimeout
+from playwright.async_api import async_playwright
 
 from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 from scripts.common.paths import DATA_DIR, SOURCES_DIR
+from scripts.common.adtraction import (
+    KR_BY_CC, SYMBOL_MAP, block_assets, scrape_category_country, to_float,
+)
 
 # =========================
 # KONFIG
@@ -24,7 +28,8 @@ AUTH_STATE = SOURCES_DIR / "base_auth.json"
 SHEET = "EPC"
 
 HEADLESS = True
-SLOW_MO_MS = 1000
+SLOW_MO_MS = 0
+MAX_PARALLEL = 4  # antal land/kategori-par som skrapas samtidigt
 
 ALL_COUNTRIES = [
     ("Sverige", 1, "SE", True),
@@ -53,33 +58,24 @@ CATEGORIES = [
 # =========================
 # Hjälp: valuta/parsing
 # =========================
-CURRENCY_REGEX = re.compile(r"(?P<val>[-+]?\d+(?:[.,]\d+)?)\s*(?P<cur>[A-Z]{3}|kr|£|€|\$|₽|₺)", re.I)
-NO_DATA_RE = re.compile(r"\b(inga\s*data|ingen\s*data|no\s*data)\b", re.I)
-
-PROGRAMS_HOME = "https://secure.adtraction.com/partner/programs.htm"
-PROGRAMS_LIST = "https://secure.adtraction.com/partner/listadvertprograms.htm"
-
-KR_BY_CC = {"SE": "SEK", "DK": "DKK", "NO": "NOK"}
-
-def to_float(s: str):
-    try:
-        return float(s.replace("\xa0", " ").replace("\u202f", " ").replace(" ", "").replace(",", "."))
-    except Exception:
-        return None
-
-async def sek_rates():
+# antingen "ingen data"-text eller värde + valuta – en sökning per cell
+EPC_CELL_RE = re.compile(
+    r"(?P<nodata>\b(?:inga|ingen|no)\s*data\b)"
+    r"|(?P<val>[-+]?\d+(?:[.,]\d+)?)\s*(?P<cur>[A-Z]{3}|kr|£|€|\$|₽|₺)",
+    re.I,
+)
+
+async def sek_rates(client: httpx.AsyncClient):
     # behövs endast för Total (i SEK)
     url = "https://api.exchangerate.host/latest?base=SEK"
-    async with httpx.AsyncClient(timeout=25) as cl:
-        r = await cl.get(url)
-        r.raise_for_status()
-        return r.json().get("rates", {})
+    r = await client.get(url)
+    r.raise_for_status()
+    return r.json().get("rates", {})
 
 def to_sek(amount: float, currency: str, rates: dict, cc: str | None = None) -> float | None:
     cur = currency.upper()
     # symbol → ISO
-    symbol_map = {"€": "EUR", "$": "USD", "£": "GBP", "₽": "RUB", "₺": "TRY"}
-    cur = symbol_map.get(cur, cur)
+    cur = SYMBOL_MAP.get(cur, cur)
     # "kr" → landets krona
     if cur.lower() == "kr":
         cur = KR_BY_CC.get((cc or "SE").upper(), "SEK")
@@ -91,12 +87,14 @@ def to_sek(amount: float, currency: str, rates: dict, cc: str | None = None) ->
     # rates är CUR per SEK → SEK = amount / rate
     return amount / rate
 
+# cellerna upprepas mycket ("-", samma belopp/valuta) – slå upp i stället för att parsa om
+@lru_cache(maxsize=4096)
 def parse_epc_cell(text: str):
-    if not text or NO_DATA_RE.search(text):
+    if not text:
         return None, None
-    text = text.replace("\u00a0", " ").replace("\u202f", " ")
-    m = CURRENCY_REGEX.search(text)
-    if not m:
+    # \s i mönstret matchar även nbsp/smalt mellanslag, ingen normalisering behövs
+    m = EPC_CELL_RE.search(text)
+    if not m or m.group("nodata"):
         return None, None
     val = to_float(m.group("val"))
     cur = m.group("cur")
@@ -107,92 +105,31 @@ def parse_epc_cell(text: str):
 # =========================
 # Skrapning
 # =========================
-async def scrape_category_country(page, cid_country: int, cid_category: int):
+async def worker(browser, auth_state: dict, session_lock: asyncio.Lock, queue: asyncio.Queue, results: list):
     """
-    Sätt land → öppna kategorilistan → läs EPC via thead-index.
-    Om tabell saknas (inga annonsörer) returneras tom lista.
+    En inloggad context + sida per worker; plockar (index, land, kategori) ur kön tills den är tom.
+    Returnerar antal par som fallerade.
     """
-    results: list[tuple[float, str]] = []
-
-    # 1) Sätt landet i serversessionen
-    await page.goto(f"{PROGRAMS_HOME}?cid={cid_country}&asonly=false", wait_until="domcontentloaded")
+    failed = 0
+    ctx = await browser.new_context(storage_state=auth_state)
+    await ctx.route("**/*", block_assets)
+    page = await ctx.new_page()
     try:
-        await page.wait_for_selector("body", timeout=8000)
-    except PWTimeout:
-        return results  # ge upp tyst
-
-    # 2) Gå till kategorilistan (utan cid – landet är satt)
-    async def open_list() -> bool:
-        await page.goto(f"{PROGRAMS_LIST}?cId={cid_category}&asonly=false", wait_until="domcontentloaded")
-        try:
-            await page.wait_for_selector("table#data", timeout=6000)
+        while True:
             try:
-                await page.wait_for_selector("table#data thead th", timeout=4000)
-            except PWTimeout:
-                try:
-                    await page.wait_for_selector("table#data tbody tr", timeout=2000)
-                except PWTimeout:
-                    return True  # behandla som tom
-            return True
-        except PWTimeout:
-            return False
-
-    ok = await open_list()
-    if not ok:
-        await page.goto(f"{PROGRAMS_HOME}?cid={cid_country}&asonly=false", wait_until="domcontentloaded")
-        ok = await open_list()
-        if not ok:
-            return results
-
-    # hitta EPC-kolumnen om headers finns; annars fallback
-    epc_idx = None
-    try:
-        headers = page.locator("table#data thead th")
-        hcount = await headers.count()
-        for i in range(hcount):
-            txt = (await headers.nth(i).inner_text()).strip().lower()
-            if txt == "epc":
-                epc_idx = i
-                break
-    except Exception:
-        pass
-
-    # paginera
-    while True:
-        rows = page.locator("table#data tbody tr")
-        n = await rows.count()
-        if n == 0:
-            break
-
-        for r in range(n):
+                i, country_id, cat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return failed
             try:
-                if epc_idx is not None:
-                    epc_cell = rows.nth(r).locator(f"td:nth-child({epc_idx + 1})").first
-                else:
-                    epc_cell = rows.nth(r).locator("td.visible-lg[align='right']").first
-                if await epc_cell.count() == 0:
-                    continue
-                epc_text = (await epc_cell.inner_text()).strip()
-                v, cur = parse_epc_cell(epc_text)
-                if v is not None and cur is not None:
-                    results.append((v, cur))
-            except Exception:
-                continue
-
-        next_btn = page.locator("a.paginate_button.next")
-        if await next_btn.count() == 0:
-            break
-        cls = await next_btn.first.get_attribute("class")
-        if cls and "disabled" in cls:
-            break
-        await next_btn.first.click()
-        await page.wait_for_timeout(400)
-        try:
-            await page.wait_for_selector("table#data tbody tr", timeout=8000)
-        except PWTimeout:
-            break
-
-    return results
+                results[i] = await scrape_category_country(
+                    page, country_id, cat_id, session_lock, parse_epc_cell, skip_empty=True
+                )
+            except Exception as e:
+                # ett par som fallerar får inte fälla övriga pars resultat – skrivs som "-"
+                print(f"cid={country_id}/cId={cat_id}: fel vid skrapning, hoppar: {e}", file=sys.stderr)
+                failed += 1
+    finally:
+        await ctx.close()
 
 # =========================
 # Excel
@@ -205,7 +142,8 @@ def build_columns(countries):
             cols.append("#")
     return cols
 
-def ensure_sheet_and_new_row(columns: list[str]) -> tuple[int, list[str]]:
+def ensure_sheet_and_new_row(columns: list[str]):
+    """Öppna (eller skapa) arbetsboken och lägg till dagens rad. Sparas inte här – anroparen sparar en gång."""
     p = Path(XLSX)
     if p.exists():
         wb = load_workbook(XLSX)
@@ -222,8 +160,7 @@ def ensure_sheet_and_new_row(columns: list[str]) -> tuple[int, list[str]]:
         row_vals[0] = datetime.now().strftime("%Y-%m-%d %H:%M")
         ws.append(row_vals)
         headers = [ws.cell(1, i+1).value for i in range(ws.max_column)]
-        wb.save(XLSX)
-        return new_row, headers
+        return wb, ws, new_row, headers
     else:
         wb = Workbook()
         ws = wb.active
@@ -232,8 +169,7 @@ def ensure_sheet_and_new_row(columns: list[str]) -> tuple[int, list[str]]:
         row_vals = ["-"] * len(columns)
         row_vals[0] = datetime.now().strftime("%Y-%m-%d %H:%M")
         ws.append(row_vals)
-        wb.save(XLSX)
-        return 2, columns
+        return wb, ws, 2, columns
 
 def build_label_index(headers: list[str]) -> dict[str, tuple[int, int]]:
     idx = {}
@@ -244,30 +180,28 @@ def build_label_index(headers: list[str]) -> dict[str, tuple[int, int]]:
             idx[name] = (i + 1, i + 2)
     return idx
 
-def write_cell(row_idx: int, col_idx_1based: int, value):
-    wb = load_workbook(XLSX)
-    ws = wb[SHEET]
-    ws.cell(row=row_idx, column=col_idx_1based, value=value)
-    wb.save(XLSX)
-
 # =========================
 # MAIN
 # =========================
 async def main():
-    rates = await sek_rates()
+    async with httpx.AsyncClient(
+        timeout=25, limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+    ) as client:
+        rates = await sek_rates(client)
 
     enabled_countries = [c for c in ALL_COUNTRIES if c[3]]
     visible_for_columns = enabled_countries if not INCLUDE_DISABLED_IN_COLUMNS else ALL_COUNTRIES
 
     columns = build_columns(visible_for_columns)
-    row_idx, headers = ensure_sheet_and_new_row(columns)
+    wb, ws, row_idx, headers = ensure_sheet_and_new_row(columns)
     label_to_cols = build_label_index(headers)
 
     total_col = headers.index("Total") + 1
     total_cnt_col = headers.index("Total #") + 1
 
     # Total i SEK – fylls EFTER hela loopen
-    total_values_sek: list[float] = []
+    total_sum_sek = 0.0
+    total_n = 0
 
     async with async_playwright() as p:
         browser = await p.chromium.launch(headless=HEADLESS, slow_mo=SLOW_MO_MS)
@@ -282,66 +216,73 @@ async def main():
         await pwd_locator.fill(PASSWORD)
         await page_login.locator("button.btn.btn-primary[type=submit]").click()
         await page_login.wait_for_url(re.compile(r"secure\.adtraction\.com/partner/.*"))
-        await ctx_base.storage_state(path=str(AUTH_STATE))
+        # sparas till fil som tidigare, men workers får dict:en direkt
+        auth_state = await ctx_base.storage_state(path=str(AUTH_STATE))
         await ctx_base.close()
 
-        # land/kategori
-        for country_name, country_id, cc, _ in enabled_countries:
-            for cat_name, cat_id in CATEGORIES:
-                ctx = await browser.new_context(storage_state=str(AUTH_STATE))
-                page = await ctx.new_page()
-                label = f"{cat_name} ({cc})"
-                try:
-                    raw = await scrape_category_country(page, country_id, cat_id)
-
-                    # 1) Filter i lokal valuta
-                    filtered_local: list[tuple[float, str]] = []
-                    for v, cur in raw:
-                        cur_u = cur.upper()
-                        if cur_u == "EUR":
-                            if 0.01 <= v <= 20:
-                                filtered_local.append((v, cur))
-                        else:
-                            if 0.1 <= v <= 200:
-                                filtered_local.append((v, cur))
-
-                    # 2) Lokal snitt (två decimaler)
-                    if filtered_local:
-                        avg_local = mean(v for v, _ in filtered_local)
-                        avg_str = f"{avg_local:.2f}".replace(".", ",")
-                        cnt_val = len(filtered_local)
-                        print(f"{label}: {avg_str} ({cnt_val})")
-                    else:
-                        avg_str, cnt_val = "-", "-"
-                        reason = "inga rader" if not raw else "alla filtrerade bort"
-                        print(f"{label}: -  [{reason}]")
-
-                    # skriv cellerna löpande
-                    val_col, cnt_col = label_to_cols[label]
-                    write_cell(row_idx, val_col, avg_str)
-                    write_cell(row_idx, cnt_col, cnt_val)
-
-                    # 3) Lägg till i Total-listan (i SEK) – först efter att lokalt filter passerats
-                    if filtered_local:
-                        for v, cur in filtered_local:
-                            v_sek = to_sek(v, cur, rates, cc=cc)
-                            if v_sek is not None:
-                                total_values_sek.append(v_sek)
-                finally:
-                    await ctx.close()
-
-        # Skriv Total / Total # EN GÅNG – nu med ALLA länder & kategorier
-        if total_values_sek:
-            total_avg = f"{mean(total_values_sek):.2f}".replace(".", ",")
-            write_cell(row_idx, total_col, total_avg)
-            write_cell(row_idx, total_cnt_col, len(total_values_sek))
-        else:
-            write_cell(row_idx, total_col, "-")
-            write_cell(row_idx, total_cnt_col, "-")
+        # land/kategori – MAX_PARALLEL workers delar på kön, resultat i samma ordning som pairs
+        pairs = [(country, cat) for country in enabled_countries for cat in CATEGORIES]
+        queue: asyncio.Queue = asyncio.Queue()
+        for i, (country, cat) in enumerate(pairs):
+            queue.put_nowait((i, country[1], cat[1]))
+        raws: list = [[] for _ in pairs]
+        # serversessionen är gemensam – landsbyte + listladdning en worker i taget
+        session_lock = asyncio.Lock()
+        failed_counts = await asyncio.gather(
+            *(worker(browser, auth_state, session_lock, queue, raws) for _ in range(MAX_PARALLEL))
+        )
+        n_failed = sum(failed_counts)
 
         await browser.close()
 
-    print(f"Klar! Uppdaterade rad för {datetime.now().strftime('%Y-%m-%d %H:%M')} i '{XLSX}' (flik: {SHEET}).")
+    # totalt avbrott – spara inte en rad med bara "-"
+    if pairs and n_failed == len(pairs):
+        raise SystemExit(f"Alla {n_failed} land/kategori-par fallerade – '{XLSX}' sparas inte.")
+
+    # Bearbeta och skriv i fast ordning (land → kategori)
+    for ((country_name, country_id, cc, _), (cat_name, cat_id)), raw in zip(pairs, raws):
+        label = f"{cat_name} ({cc})"
+
+        # 1) Filter i lokal valuta (EUR: 0,01–20, övriga: 0,1–200) – som en mask över alla rader
+        vals = np.fromiter((v for v, _ in raw), dtype=np.float64, count=len(raw))
+        is_eur = np.fromiter((cur.upper() == "EUR" for _, cur in raw), dtype=bool, count=len(raw))
+        keep = np.where(is_eur, (vals >= 0.01) & (vals <= 20), (vals >= 0.1) & (vals <= 200))
+        filtered_local = [raw[i] for i in np.flatnonzero(keep)]
+
+        # 2) Lokal snitt (två decimaler)
+        if filtered_local:
+            avg_local = float(vals[keep].mean())
+            avg_str = f"{avg_local:.2f}".replace(".", ",")
+            cnt_val = len(filtered_local)
+            print(f"{label}: {avg_str} ({cnt_val})")
+        else:
+            avg_str, cnt_val = "-", "-"
+            reason = "inga rader" if not raw else "alla filtrerade bort"
+            print(f"{label}: -  [{reason}]")
+
+        vcol, ccol = label_to_cols[label]
+        ws.cell(row=row_idx, column=vcol).value = avg_str
+        ws.cell(row=row_idx, column=ccol).value = cnt_val
+
+        # 3) Lägg till i Total-listan (i SEK) – först efter att lokalt filter passerats
+        if filtered_local:
+            for v, cur in filtered_local:
+                v_sek = to_sek(v, cur, rates, cc=cc)
+                if v_sek is not None:
+                    total_sum_sek += v_sek
+                    total_n += 1
+
+    # Skriv Total / Total # EN GÅNG – nu med ALLA länder & kategorier
+    if total_n:
+        total_avg = f"{total_sum_sek / total_n:.2f}".replace(".", ",")
+        ws.cell(row=row_idx, column=total_col).value = total_avg
+        ws.cell(row=row_idx, column=total_cnt_col).value = total_n
+    else:
+        ws.cell(row=row_idx, column=total_col).value = "-"
+        ws.cell(row=row_idx, column=total_cnt_col).value = "-"
+
+    wb.save(XLSX)
+    print(f"Klar! Uppdaterade rad för {datetime.now().strftime('%Y-%m-%d %H:%M')} i '{XLSX}' (flik: {SHEET}), antal fel: {n_failed}.")
 
 if __name__ == "__main__":
     asyncio.run(main())
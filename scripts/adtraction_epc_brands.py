@@ -15,6 +15,7 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 from scripts.common.paths import DATA_DIR, HISTORY_DIR, SOURCES_DIR  # noqa: E402
+from scripts.common.adtraction import NEXT_PAGE_JS, to_float  # noqa: E402
 
 # =========================
 # KONFIG
@@ -38,12 +39,13 @@ COUNTRIES = [
     ("Schweiz", 44, "CH", True),
     ("Frankrike", 15, "FR", False),
     ("Italien", 22, "IT", False),
-    ("Polen", 34, "PL", False,
+    ("Polen", 34, "PL", False),
     ("Nederländerna", 32, "NL", True),
 ]
 
 HEADLESS = not SHOW_PROGRESS
 SLOW_MO_MS = 400 if SHOW_PROGRESS else 0
+MAX_PARALLEL = 4  # antal länder som skrapas samtidigt
 
 PROGRAMS_HOME = "https://secure.adtraction.com/partner/programs.htm"
 LIST_ALL_URL = "https://secure.adtraction.com/partner/listadvertprograms.htm?cld=-1&asonly=false"
@@ -70,36 +72,43 @@ def log(msg: str):
         print(msg, flush=True)
 
 
-def to_float(s: str) -> Optional[float]:
-    try:
-        s = s.replace("\xa0", " ").replace("\u202f", " ").replace(" ", "").replace(",", ".")
-        return float(s)
-    except Exception:
-        return None
-
-
 def parse_epc_cell(text: str) -> Optional[float]:
     if not text or NO_DATA_RE.search(text):
         return None
-    text = text.replace("\xa0", " ").replace("\u202f", " ")
+    # \s i mönstret matchar även nbsp/smalt mellanslag, ingen normalisering behövs
     m = CURRENCY_RE.search(text)
     if not m:
         return None
     return to_float(m.group("val"))
 
 
+# i prioritetsordning – första avgränsaren som finns vinner, även om en senare står tidigare i texten
+BRAND_SEPARATORS = (":", " - ", "-", "—", "(")
+
 def clean_brand_name(txt: str) -> str:
     txt = " ".join(txt.split())  # komprimera whitespace
-    for sep in [":", " - ", "-", "—", "("]:
-        if sep in txt:
-            txt = txt.split(sep)[0].strip()
-            break
+    for sep in BRAND_SEPARATORS:
+        head, found, _ = txt.partition(sep)
+        if found:
+            return head.strip()
     return txt
 
 
 # =========================
 # NAVIGERING
 # =========================
+CLICK_SHOW_ALL_JS = """
+() => {
+  for (const el of document.querySelectorAll("a, button")) {
+    if ((el.textContent || "").replace(/\\s+/g, " ").toLowerCase().includes("visa alla")) {
+      el.click();
+      return true;
+    }
+  }
+  return false;
+}
+"""
+
 async def go_country_and_open_list(page, country_id: int) -> bool:
     url = f"{PROGRAMS_HOME}?cid={country_id}&asonly=false"
     log(f"-> Öppnar {url}")
@@ -110,12 +119,10 @@ async def go_country_and_open_list(page, country_id: int) -> bool:
         log("   ! Hittade inte 'Alla annonsörer'-rubriken.")
         return False
 
-    # Klicka “Visa alla …” (knappen heter t.ex. ‘Visa alla (515)’)
+    # Klicka “Visa alla …” (knappen heter t.ex. ‘Visa alla (515)’) – hitta + klicka i ett anrop
     try:
-        btn = page.locator("a:has-text('Visa alla'), button:has-text('Visa alla')").first
-        if await btn.count() > 0:
-            log("-> Klickar ‘Visa alla …’")
-            await btn.click()
+        if await page.evaluate(CLICK_SHOW_ALL_JS):
+            log("-> Klickade ‘Visa alla …’")
             await page.wait_for_selector("table#data", timeout=8000)
             return True
     except Exception:
@@ -134,69 +141,40 @@ async def go_country_and_open_list(page, country_id: int) -> bool:
 # =========================
 # SKRAPA RADER
 # =========================
+# per rad: namnkandidater i fallback-ordning (null där selektorn saknas) + EPC-cellens text
+ROWS_JS = """
+rows => rows.map(r => {
+  const text = sel => { const el = r.querySelector(sel); return el ? el.textContent : null; };
+  return {
+    names: [text("a.advprog"), text("td:nth-child(2) a"), text("td:nth-child(2)"), text("td a")],
+    epc: text("td.visible-lg[align='right']"),
+  };
+})
+"""
+
 async def scrape_all_rows(page) -> List[BrandRow]:
     """Returnerar hela listan (i visningsordning = rank) som BrandRow."""
     out: List[BrandRow] = []
 
     while True:
-        rows = page.locator("table#data tbody tr")
-        n = await rows.count()
-        if n == 0:
+        # namnkandidater + EPC-text för alla rader i ett anrop
+        rows = await page.eval_on_selector_all("table#data tbody tr", ROWS_JS)
+        if not rows:
             break
 
-        for r in range(n):
-            row = rows.nth(r)
-
-            # --- Namn: <a class="advprog"> (fallbacks ingår)
-            name = None
-            try:
-                a = row.locator("a.advprog").first
-                if await a.count() > 0:
-                    txt = await a.text_content()
-                    if txt:
-                        name = clean_brand_name(txt)
-            except Exception:
-                name = None
-
-            if not name:
-                # fallback: andra tänkbara länkar/celler
-                for sel in [
-                    "td:nth-child(2) a",
-                    "td:nth-child(2)",
-                    "td a",
-                ]:
-                    try:
-                        cand = row.locator(sel).first
-                        if await cand.count() > 0:
-                            txt = await cand.text_content()
-                            if txt:
-                                name = clean_brand_name(txt)
-                                if name:
-                                    break
-                    except Exception:
-                        continue
+        for r in rows:
+            # --- Namn: <a class="advprog">, annars fallbacks i ordning
+            name = next((n for n in map(clean_brand_name, filter(None, r["names"])) if n), None)
 
             # --- EPC: <td class="visible-lg" align="right">
-            epc: Optional[float] = None
-            try:
-                epc_cell = row.locator("td.visible-lg[align='right']").first
-                if await epc_cell.count() > 0:
-                    epc_text = (await epc_cell.text_content() or "").strip()
-                    epc = parse_epc_cell(epc_text)
-            except Exception:
-                epc = None
+            epc = parse_epc_cell(r["epc"].strip()) if r["epc"] else None
 
             if name:
                 out.append(BrandRow(name=name, epc=epc))
 
-        # Nästa sida?
-        next_btn = page.locator("a.paginate_button.next")
-        if await next_btn.count() == 0:
-            break
-        cls = await next_btn.first.get_attribute("class")
-        if cls and "disabled" in cls:
+        # Nästa sida? (klickar endast en aktiv "nästa"-knapp)
+        if not await page.evaluate(NEXT_PAGE_JS):
             break
-        await next_btn.first.click()
         await page.wait_for_timeout(350)
         try:
             await page.wait_for_selector("table#data tbody tr", timeout=8000)
@@ -210,14 +188,36 @@ async def scrape_all_rows(page) -> List[BrandRow]:
     return out
 
 
+async def scrape_one(country: Tuple[str, int, str, bool], ctx, sem: asyncio.Semaphore, session_lock: asyncio.Lock) -> Optional[List[BrandRow]]:
+    """
+    Skrapar ett land i en egen flik i den inloggade contexten. None = listan gick inte att öppna.
+    Flikarna delar serversessionen (och därmed valt land), så landsbyte + listladdning körs
+    under session_lock; när tabellen väl finns i sidan pagineras den utan servern.
+    """
+    country_name, country_id, sheet, _on = country
+    async with sem:
+        log(f"===== {sheet} ({country_name}) =====")
+        page = await ctx.new_page()
+        try:
+            async with session_lock:
+                ok = await go_country_and_open_list(page, country_id)
+            if not ok:
+                log(f"[{sheet}] Kunde inte öppna ‘Visa alla’. Hoppar.")
+                return None
+            return await scrape_all_rows(page)
+        except Exception as e:
+            # ett land som fallerar får inte fälla övriga länders resultat (sparas i en gemensam save)
+            print(f"[{sheet}] Fel vid skrapning, hoppar: {e}", file=sys.stderr)
+            return None
+        finally:
+            await page.close()
+
+
 # =========================
 # EXCEL
 # =========================
-def ensure_sheet_and_new_row(sheet_name: str) -> Tuple[int, List[str]]:
-    """Skapa blad vid behov. Skapa ny rad och sätt datum i kol A. Returnerar (row_index, headers)."""
-    p = Path(XLSX)
-    wb = load_workbook(XLSX) if p.exists() else Workbook()
-
+def ensure_sheet_and_new_row(wb, sheet_name: str) -> Tuple[object, int, List[str]]:
+    """Skapa blad vid behov. Skapa ny rad och sätt datum i kol A. Returnerar (ws, row_index, headers). Sparas inte här."""
     if sheet_name in wb.sheetnames:
         ws = wb[sheet_name]
     else:
@@ -238,14 +238,11 @@ def ensure_sheet_and_new_row(sheet_name: str) -> Tuple[int, List[str]]:
     ws.cell(new_row, 1).value = now_se
     ws.cell(new_row, 1).number_format = DATE_FORMAT
 
-    wb.save(XLSX)
-    return new_row, headers
+    return ws, new_row, headers
 
 
-def ensure_brand_columns(sheet_name: str, brand_names: List[str]) -> List[str]:
+def ensure_brand_columns(ws, brand_names: List[str]) -> List[str]:
     """Säkerställ att varje ‘brand’ har två kolumner: <Brand> och ‘#’."""
-    wb = load_workbook(XLSX)
-    ws = wb[sheet_name]
     headers = [ws.cell(1, c).value for c in range(1, ws.max_column + 1)]
     updated = False
     for brand in brand_names:
@@ -254,39 +251,40 @@ def ensure_brand_columns(sheet_name: str, brand_names: List[str]) -> List[str]:
             ws.cell(1, ws.max_column + 1, value="#")
             updated = True
     if updated:
-        wb.save(XLSX)
         headers = [ws.cell(1, c).value for c in range(1, ws.max_column + 1)]
     return headers
 
 
-def index_maps(sheet_name: str) -> Tuple[Dict[str, int], Dict[str, int]]:
+def index_maps(ws) -> Tuple[Dict[str, int], Dict[str, int]]:
     """Returnerar (värdekolumner, rankkolumner) för alla brand-par i bladet."""
-    wb = load_workbook(XLSX)
-    ws = wb[sheet_name]
+    headers = [c.value for c in ws[1]]
     value_cols: Dict[str, int] = {}
     rank_cols: Dict[str, int] = {}
-    c = 2  # startar efter Datum
-    while c <= ws.max_column:
-        header = ws.cell(1, c).value
+    to_insert: List[int] = []  # kolumner (1-baserade) som saknar ‘#’
+    i = 1  # 0-baserat, startar efter Datum
+    while i < len(headers):
+        header = headers[i]
         if header and header not in ("Datum", "#"):
-            value_cols[header] = c
-            if c + 1 > ws.max_column or ws.cell(1, c + 1).value != "#":
-                ws.cell(1, c + 1, value="#")
-                wb.save(XLSX)
-            rank_cols[header] = c + 1
-            c += 2
+            value_cols[header] = i + 1
+            if i + 1 >= len(headers):
+                headers.append("#")
+                to_insert.append(i + 2)
+            elif headers[i + 1] != "#":
+                headers[i + 1] = "#"
+                to_insert.append(i + 2)
+            rank_cols[header] = i + 2
+            i += 2
         else:
-            c += 1
+            i += 1
+    for col in to_insert:
+        ws.cell(1, col, value="#")
     return value_cols, rank_cols
 
 
-def write_cell(sheet_name: str, row: int, col: int, value, number_format: Optional[str] = None):
-    wb = load_workbook(XLSX)
-    ws = wb[sheet_name]
+def write_cell(ws, row: int, col: int, value, number_format: Optional[str] = None):
     cell = ws.cell(row=row, column=col, value=value)
     if number_format:
         cell.number_format = number_format
-    wb.save(XLSX)
 
 
 # =========================
@@ -324,68 +322,79 @@ async def main():
         await page0.locator("#password, input[type='password'], input[name='password']").first.fill(PASSWORD)
         await page0.locator("button.btn.btn-primary[type=submit]").click()
         await page0.wait_for_url(re.compile(r"secure\.adtraction\.com/partner/.*"))
+        # sparas till fil som tidigare; själva skrapningen återanvänder den inloggade contexten
         await ctx0.storage_state(path=str(AUTH_STATE))
-        await ctx0.close()
+        await page0.close()
 
-        for country_name, country_id, sheet, _on in enabled:
-            log(f"===== {sheet} ({country_name}) =====")
-            row_idx, headers = ensure_sheet_and_new_row(sheet)
-
-            ctx = await browser.new_context(storage_state=str(AUTH_STATE))
-            page = await ctx.new_page()
-            try:
-                ok = await go_country_and_open_list(page, country_id)
-                if not ok:
-                    log(f"[{sheet}] Kunde inte öppna ‘Visa alla’. Hoppar.")
-                    continue
+        # alla länder parallellt (högst MAX_PARALLEL flikar åt gången), resultat i samma ordning som enabled
+        sem = asyncio.Semaphore(MAX_PARALLEL)
+        # serversessionen är gemensam – landsbyte + listladdning en flik i taget
+        session_lock = asyncio.Lock()
+        try:
+            results = await asyncio.gather(*(scrape_one(c, ctx0, sem, session_lock) for c in enabled))
+        finally:
+            await ctx0.close()
 
-                all_rows = await scrape_all_rows(page)
-                top10 = all_rows[:10]
+        await browser.close()
 
-                # Spara vinnaren (#1) för sammanfattningen
-                if top10:
-                    winners.append((sheet, top10[0].name, top10[0].epc))
+    # None = landet fallerade (fel eller listan gick inte att öppna)
+    n_failed = sum(r is None for r in results)
+    # totalt avbrott – spara inte blad med bara "-"
+    if enabled and n_failed == len(enabled):
+        raise SystemExit(f"Alla {n_failed} länder fallerade – '{XLSX}' sparas inte.")
+
+    # Excel skrivs i följd efter skrapningen (openpyxl tål inte samtidiga skrivningar)
+    # arbetsboken läses och sparas en gång – alla celler ändras i minnet däremellan
+    wb = load_workbook(XLSX) if XLSX.exists() else Workbook()
+    for (country_name, country_id, sheet, _on), all_rows in zip(enabled, results):
+        ws, row_idx, headers = ensure_sheet_and_new_row(wb, sheet)
+        if all_rows is None:
+            continue
+
+        top10 = all_rows[:10]
+
+        # Spara vinnaren (#1) för sammanfattningen
+        if top10:
+            winners.append((sheet, top10[0].name, top10[0].epc))
+        else:
+            winners.append((sheet, "-", None))
+
+        # Säkerställ kolumner för dagens top-10 (nya varumärken läggs till)
+        headers = ensure_brand_columns(ws, [br.name for br in top10])
+
+        # Indexera kolumner
+        value_cols, rank_cols = index_maps(ws)
+
+        # normaliserat namn → första radindex, så att varje varumärke slås upp direkt
+        name_to_idx: Dict[str, int] = {}
+        for i, br in enumerate(all_rows):
+            name_to_idx.setdefault(br.name.strip().lower(), i)
+
+        # Skriv värden för ALLA kända varumärken i bladets header
+        known_brands = [h for h in headers if h and h not in ("Datum", "#")]
+        for brand in known_brands:
+            i = name_to_idx.get(brand.strip().lower())
+            epc = all_rows[i].epc if i is not None else None
+            rank = i + 1 if i is not None and i < 10 else None
+
+            vcol = value_cols.get(brand)
+            rcol = rank_cols.get(brand)
+            if vcol:
+                if epc is None:
+                    write_cell(ws, row_idx, vcol, "-")
+                else:
+                    write_cell(ws, row_idx, vcol, round(epc, 2), NUMBER_FORMAT_VALUE)
+            if rcol:
+                if rank is None:
+                    write_cell(ws, row_idx, rcol, "-")
                 else:
-                    winners.append((sheet, "-", None))
-
-                # Säkerställ kolumner för dagens top-10 (nya varumärken läggs till)
-                headers = ensure_brand_columns(sheet, [br.name for br in top10])
-
-                # Indexera kolumner
-                value_cols, rank_cols = index_maps(sheet)
-
-                # Skriv värden för ALLA kända varumärken i bladets header
-                known_brands = [h for h in headers if h and h not in ("Datum", "#")]
-                for brand in known_brands:
-                    epc = None
-                    rank = None
-                    for i, br in enumerate(all_rows):
-                        if br.name.strip().lower() == brand.strip().lower():
-                            epc = br.epc
-                            rank = i + 1 if i < 10 else None
-                            break
-
-                    vcol = value_cols.get(brand)
-                    rcol = rank_cols.get(brand)
-                    if vcol:
-                        if epc is None:
-                            write_cell(sheet, row_idx, vcol, "-")
-                        else:
-                            write_cell(sheet, row_idx, vcol, round(epc, 2), NUMBER_FORMAT_VALUE)
-                    if rcol:
-                        if rank is None:
-                            write_cell(sheet, row_idx, rcol, "-")
-                        else:
-                            write_cell(sheet, row_idx, rcol, int(rank), NUMBER_FORMAT_RANK)
-
-                if SHOW_PROGRESS:
-                    dbg = ", ".join([f"{i+1}. {br.name}" for i, br in enumerate(top10)])
-                    log(f"[{sheet}] Top-10 idag: {dbg}")
-
-            finally:
-                await ctx.close()
+                    write_cell(ws, row_idx, rcol, int(rank), NUMBER_FORMAT_RANK)
 
-        await browser.close()
+        if SHOW_PROGRESS:
+            dbg = ", ".join([f"{i+1}. {br.name}" for i, br in enumerate(top10)])
+            log(f"[{sheet}] Top-10 idag: {dbg}")
+
+    wb.save(XLSX)
 
     # ===== Alltid skriv ut en “vinnare-rad” (begränsad till SE, DK, NO, FI) =====
     wanted = ["SE", "DK", "NO", "FI"]
@@ -402,7 +411,7 @@ async def main():
         summary = "Adtraction: " + ", ".join(parts[:-1]) + ("" if len(parts) == 1 else f" & {parts[-1]}.")
         if len(parts) == 1:
             summary += "."
-        print(summary)
+        print(f"{summary} Antal fel: {n_failed}.")
 
 
 if __name__ == "__main__":
@@ -1,16 +1,19 @@
 import asyncio
 import re, sys
 from datetime import datetime
-from statistics import mean, median
 
+import numpy as np
 from openpyxl import Workbook, load_workbook
-from playwright.async_api import async_playwright, TimeoutError as PWTimeout
+from playwright.async_api import async_playwright
 
 from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 from scripts.common.paths import DATA_DIR, SOURCES_DIR
+from scripts.common.adtraction import (
+    KR_BY_CC, SYMBOL_MAP, scrape_category_country, to_float,
+)
 
 # =========================
 # KONFIG
@@ -32,7 +35,8 @@ SHEETS = [
 ]
 
 HEADLESS = True
-SLOW_MO_MS = 1000
+SLOW_MO_MS = 0  # >0 endast vid felsökning
+MAX_PARALLEL = 4  # antal land/kategori-par som skrapas samtidigt
 
 ALL_COUNTRIES = [
     ("Sverige", 1, "SE", True),
@@ -60,21 +64,9 @@ CATEGORIES = [
 CURRENCY_REGEX = re.compile(r"(?P<val>[-+]?\d+(?:[.,]\d+)?)\s*(?P<cur>[A-Z]{3}|kr|£|€|\$|₽|₺)", re.I)
 NO_DATA_RE = re.compile(r"\b(inga\s*data|ingen\s*data|no\s*data)\b", re.I)
 
-PROGRAMS_HOME = "https://secure.adtraction.com/partner/programs.htm"
-PROGRAMS_LIST = "https://secure.adtraction.com/partner/listadvertprograms.htm"
-
-KR_BY_CC = {"SE": "SEK", "DK": "DKK", "NO": "NOK"}
-
-def to_float(s: str):
-    try:
-        return float(s.replace("\xa0", " ").replace("\u202f", " ").replace(" ", "").replace(",", "."))
-    except Exception:
-        return None
-
 def normalize_currency(cur: str, cc: str | None) -> str | None:
-    symbol_map = {"€": "EUR", "$": "USD", "£": "GBP", "₽": "RUB", "₺": "TRY"}
     c = (cur or "").upper()
-    c = symbol_map.get(c, c)
+    c = SYMBOL_MAP.get(c, c)
     if c.lower() == "kr":
         c = KR_BY_CC.get((cc or "SE").upper(), "SEK")
     return c
@@ -82,7 +74,7 @@ def normalize_currency(cur: str, cc: str | None) -> str | None:
 def parse_epc_cell(text: str):
     if not text or NO_DATA_RE.search(text):
         return None, None
-    text = text.replace("\u00a0", " ").replace("\u202f", " ")
+    # \s i mönstret matchar även nbsp/smalt mellanslag, ingen normalisering behövs
     m = CURRENCY_REGEX.search(text)
     if not m:
         return None, None
@@ -106,89 +98,33 @@ FILTERS_3_120 = {
     "OTHER": (3, 120),
 }
 
-def in_range(value: float, iso_currency: str, variant: str) -> bool:
-    rules = FILTERS_0_200 if variant == "0_200" else FILTERS_3_120
-    lo, hi = rules.get(iso_currency, rules["OTHER"])
-    return (value is not None) and (lo <= value <= hi)
-
 # =========================
 # Skrapning
 # =========================
-async def scrape_category_country(page, cid_country: int, cid_category: int):
-    results: list[tuple[float, str]] = []
-
-    await page.goto(f"{PROGRAMS_HOME}?cid={cid_country}&asonly=false", wait_until="domcontentloaded")
+async def worker(ctx, session_lock: asyncio.Lock, queue: asyncio.Queue, results: list):
+    """
+    En flik per worker i den inloggade contexten; plockar land/kategori-par ur kön tills den är tom.
+    Returnerar antal par som fallerade.
+    """
+    failed = 0
+    page = await ctx.new_page()
     try:
-        await page.wait_for_selector("body", timeout=8000)
-    except PWTimeout:
-        return results
-
-    async def open_list() -> bool:
-        await page.goto(f"{PROGRAMS_LIST}?cId={cid_category}&asonly=false", wait_until="domcontentloaded")
-        try:
-            await page.wait_for_selector("table#data", timeout=6000)
+        while True:
             try:
-                await page.wait_for_selector("table#data thead th", timeout=4000)
-            except PWTimeout:
-                try:
-                    await page.wait_for_selector("table#data tbody tr", timeout=2000)
-                except PWTimeout:
-                    return True
-            return True
-        except PWTimeout:
-            return False
-
-    ok = await open_list()
-    if not ok:
-        await page.goto(f"{PROGRAMS_HOME}?cid={cid_country}&asonly=false", wait_until="domcontentloaded")
-        ok = await open_list()
-        if not ok:
-            return results
-
-    epc_idx = None
-    try:
-        headers = page.locator("table#data thead th")
-        hcount = await headers.count()
-        for i in range(hcount):
-            txt = (await headers.nth(i).inner_text()).strip().lower()
-            if txt == "epc":
-                epc_idx = i
-                break
-    except Exception:
-        pass
-
-    while True:
-        rows = page.locator("table#data tbody tr")
-        n = await rows.count()
-        if n == 0:
-            break
-
-        for r in range(n):
+                i, (country_name, country_id, cc, _), (cat_name, cat_id) = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return failed
             try:
-                epc_cell = rows.nth(r).locator(f"td:nth-child({epc_idx + 1})").first if epc_idx is not None else rows.nth(r).locator("td.visible-lg[align='right']").first
-                if await epc_cell.count() == 0:
-                    continue
-                epc_text = (await epc_cell.inner_text()).strip()
-                v, cur = parse_epc_cell(epc_text)
-                if v is not None and cur is not None:
-                    results.append((v, cur))
-            except Exception:
+                results[i] = await scrape_category_country(page, country_id, cat_id, session_lock, parse_epc_cell)
+            except Exception as e:
+                # ett par som fallerar får inte fälla övriga pars resultat – skrivs som "-"
+                print(f"{country_name}/{cat_name}: fel vid skrapning, hoppar: {e}", file=sys.stderr)
+                failed += 1
                 continue
-
-        next_btn = page.locator("a.paginate_button.next")
-        if await next_btn.count() == 0:
-            break
-        cls = await next_btn.first.get_attribute("class")
-        if cls and "disabled" in cls:
-            break
-        await next_btn.first.click()
-        await page.wait_for_timeout(400)
-        try:
-            await page.wait_for_selector("table#data tbody tr", timeout=8000)
-        except PWTimeout:
-            break
-
-    return results
+            if SHOW_PROGRESS:
+                print(f"{country_name}/{cat_name}: {len(results[i])} rader lästa")
+    finally:
+        await page.close()
 
 # =========================
 # Excel-hjälp
@@ -208,9 +144,8 @@ def build_columns(countries):
 def _sheet_is_empty(ws) -> bool:
     return ws.max_row == 1 and ws.max_column == 1 and (ws.cell(1, 1).value in (None, ""))
 
-def ensure_sheet_and_new_row(sheet_name: str, columns: list[str]) -> tuple[int, list[str]]:
-    p = Path(XLSX)
-    wb = load_workbook(XLSX) if p.exists() else Workbook()
+def ensure_sheet_and_new_row(wb, sheet_name: str, columns: list[str]):
+    """Lägg till dagens rad i bladet (skapas vid behov). Sparas inte här – anroparen sparar en gång."""
     if sheet_name in wb.sheetnames:
         ws = wb[sheet_name]
     else:
@@ -238,8 +173,7 @@ def ensure_sheet_and_new_row(sheet_name: str, columns: list[str]) -> tuple[int,
     ws.cell(row=new_row, column=1).number_format = "YYYY-MM-DD HH:MM"
 
     headers = [ws.cell(1, i + 1).value for i in range(ws.max_column)]
-    wb.save(XLSX)
-    return new_row, headers
+    return ws, new_row, headers
 
 def build_label_indexes(headers: list[str]) -> tuple[dict[str, int], dict[str, int]]:
     value_cols: dict[str, int] = {}
@@ -254,13 +188,10 @@ def build_label_indexes(headers: list[str]) -> tuple[dict[str, int], dict[str, i
             count_cols[cc] = i
     return value_cols, count_cols
 
-def write_cell(sheet_name: str, row_idx: int, col_idx_1based: int, value, number_format: str | None = None):
-    wb = load_workbook(XLSX)
-    ws = wb[sheet_name]
+def write_cell(ws, row_idx: int, col_idx_1based: int, value, number_format: str | None = None):
     cell = ws.cell(row=row_idx, column=col_idx_1based, value=value)
     if number_format:
         cell.number_format = number_format
-    wb.save(XLSX)
 
 NUMBER_FORMAT_VALUE = "#,##0.00"  # två decimaler, mellanslag som tusentalsavgränsare
 NUMBER_FORMAT_COUNT = "# ##0"
@@ -268,18 +199,27 @@ NUMBER_FORMAT_COUNT = "# ##0"
 # =========================
 # Beräkning
 # =========================
-def compute_value(filtered_local: list[float], metric: str) -> float | None:
-    if not filtered_local:
+def compute_value(filtered_local: np.ndarray, metric: str) -> float | None:
+    if not filtered_local.size:
         return None
-    return (median(filtered_local) if metric == "median" else mean(filtered_local))
+    return float(np.median(filtered_local) if metric == "median" else filtered_local.mean())
+
+def to_arrays(raw_items: list[tuple[float, str]], cc: str) -> tuple[np.ndarray, np.ndarray]:
+    """(värden, ISO-valutor) – valutan normaliseras en gång per land/kategori och delas av alla varianter."""
+    vals = np.fromiter((v for v, _ in raw_items), dtype=np.float64, count=len(raw_items))
+    curs = np.array([normalize_currency(cur, cc) or "OTHER" for _, cur in raw_items], dtype=object)
+    return vals, curs
 
-def apply_variant_filter(raw_items: list[tuple[float, str]], cc: str, variant: str) -> list[float]:
-    vals: list[float] = []
-    for v, cur in raw_items:
-        iso = normalize_currency(cur, cc) or "OTHER"
-        if in_range(v, iso, variant):
-            vals.append(v)
-    return vals
+def apply_variant_filter(vals: np.ndarray, curs: np.ndarray, variant: str) -> np.ndarray:
+    rules = FILTERS_0_200 if variant == "0_200" else FILTERS_3_120
+    # gränser per rad: OTHER som standard, skrivs över för valutor med egna regler
+    lo = np.full(vals.shape, rules["OTHER"][0], dtype=np.float64)
+    hi = np.full(vals.shape, rules["OTHER"][1], dtype=np.float64)
+    for iso, (r_lo, r_hi) in rules.items():
+        m = curs == iso
+        lo[m] = r_lo
+        hi[m] = r_hi
+    return vals[(vals >= lo) & (vals <= hi)]
 
 # =========================
 # MAIN
@@ -305,47 +245,63 @@ async def main():
         await pwd_locator.fill(PASSWORD)
         await page_login.locator("button.btn.btn-primary[type=submit]").click()
         await page_login.wait_for_url(re.compile(r"secure\.adtraction\.com/partner/.*"))
+        # sparas till fil som tidigare; själva skrapningen återanvänder den inloggade contexten
         await ctx_base.storage_state(path=str(AUTH_STATE))
-        await ctx_base.close()
+        await page_login.close()
 
         # Skrapa rådata en gång per land/kategori
-        raw_map: dict[tuple[str, int], list[tuple[float, str]]] = {}
-        for country_name, country_id, cc, _ in enabled_countries:
-            for cat_name, cat_id in CATEGORIES:
-                ctx = await browser.new_context(storage_state=str(AUTH_STATE))
-                page = await ctx.new_page()
-                try:
-                    raw = await scrape_category_country(page, country_id, cat_id)
-                    raw_map[(cc, cat_id)] = raw
-                    if SHOW_PROGRESS:
-                        print(f"{country_name}/{cat_name}: {len(raw)} rader lästa")
-                finally:
-                    await ctx.close()
+        # MAX_PARALLEL workers delar på kön, resultat i samma ordning som pairs
+        pairs = [(country, cat) for country in enabled_countries for cat in CATEGORIES]
+        queue: asyncio.Queue = asyncio.Queue()
+        for i, (country, cat) in enumerate(pairs):
+            queue.put_nowait((i, country, cat))
+        raws: list = [[] for _ in pairs]
+        # serversessionen är gemensam – landsbyte + listladdning en flik i taget
+        session_lock = asyncio.Lock()
+        try:
+            failed_counts = await asyncio.gather(
+                *(worker(ctx_base, session_lock, queue, raws) for _ in range(MAX_PARALLEL))
+            )
+        finally:
+            await ctx_base.close()
+        n_failed = sum(failed_counts)
+
+        # totalt avbrott – spara inte fyra blad med bara "-"
+        if pairs and n_failed == len(pairs):
+            await browser.close()
+            raise SystemExit(f"Alla {n_failed} land/kategori-par fallerade – '{XLSX}' sparas inte.")
+
+        raw_map: dict[tuple[str, int], tuple[np.ndarray, np.ndarray]] = {
+            (country[2], cat[1]): to_arrays(raw, country[2]) for (country, cat), raw in zip(pairs, raws)
+        }
+        no_data = to_arrays([], "")
 
         columns = build_columns(visible_for_columns)
 
         # här sparar vi medianerna för EPC_0_200_median (för utskriften i slutet)
         epc_values: dict[str, str] = {}
 
+        # arbetsboken läses och sparas en gång – alla fyra bladen ändras i minnet däremellan
+        wb = load_workbook(XLSX) if Path(XLSX).exists() else Workbook()
         for sheet_name, variant, metric in SHEETS:
-            row_idx, headers = ensure_sheet_and_new_row(sheet_name, columns)
+            ws, row_idx, headers = ensure_sheet_and_new_row(wb, sheet_name, columns)
             value_cols, count_cols = build_label_indexes(headers)
 
             for country_name, country_id, cc, _ in visible_for_columns:
                 for cat_name, cat_id in CATEGORIES:
                     label = f"{cat_name} ({cc})"
 
-                    raw = raw_map.get((cc, cat_id), [])
-                    filtered_vals = apply_variant_filter(raw, cc, variant)
+                    vals, curs = raw_map.get((cc, cat_id), no_data)
+                    filtered_vals = apply_variant_filter(vals, curs, variant)
                     val_num = compute_value(filtered_vals, metric)
-                    cnt_num = len(filtered_vals) if filtered_vals else None
+                    cnt_num = filtered_vals.size or None
 
                     # skriv EPC (två decimaler) som tal
                     vcol = value_cols[label]
                     if val_num is None:
-                        write_cell(sheet_name, row_idx, vcol, "-")
+                        write_cell(ws, row_idx, vcol, "-")
                     else:
-                        write_cell(sheet_name, row_idx, vcol, round(val_num, 2), NUMBER_FORMAT_VALUE)
+                        write_cell(ws, row_idx, vcol, round(val_num, 2), NUMBER_FORMAT_VALUE)
 
                         # Om detta är EPC_0_200_median → bygg epc_values (med komma-decimal)
                         if sheet_name == "EPC_0_200_median":
@@ -354,20 +310,22 @@ async def main():
                     # skriv count i "# CC"
                     ccol = count_cols[cc]
                     if cnt_num is None:
-                        write_cell(sheet_name, row_idx, ccol, "-")
+                        write_cell(ws, row_idx, ccol, "-")
                     else:
-                        write_cell(sheet_name, row_idx, ccol, int(cnt_num), NUMBER_FORMAT_COUNT)
+                        write_cell(ws, row_idx, ccol, int(cnt_num), NUMBER_FORMAT_COUNT)
 
             if SHOW_PROGRESS:
                 print(f"Skrev rad i {sheet_name}")
 
+        wb.save(XLSX)
+
         await browser.close()
 
     # Slutlig sammanfattning – alltid
     print(
         f"Adtraction: SE = {epc_values.get('SE','-')}, DK = {epc_values.get('DK','-')}, "
         f"NO = {epc_values.get('NO','-')}, FI = {epc_values.get('FI','-')}, "
-        f"ES = {epc_values.get('ES','-')} & DE = {epc_values.get('DE','-')}."
+        f"ES = {epc_values.get('ES','-')} & DE = {epc_values.get('DE','-')}. Antal fel: {n_failed}."
     )
 
 if __name__ == "__main__":
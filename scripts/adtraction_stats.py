@@ -23,56 +23,63 @@ LABELS = {
     "Konverteringar": "conversions",
     "Varumärken": "brands",
 }
+_SPACE_STRIP = str.maketrans("", "", " \u00a0\u202f")
+# etikett → förkompilerat mönster "Etikett  1 234 567"
+LABEL_RES = {label: re.compile(rf"{label}\s+([0-9 ][0-9 ]+)") for label in LABELS}
+
+# en session för hela körningen (återanvänd TCP/TLS-anslutning)
+SESSION = requests.Session()
+SESSION.headers.update({"User-Agent": "Mozilla/5.0"})
 
 def fetch_html(url: str) -> str:
-    headers = {"User-Agent": "Mozilla/5.0"}
-    r = requests.get(url, headers=headers, timeout=30)
+    r = SESSION.get(url, timeout=30)
     r.raise_for_status()
     return r.text
 
 def parse_numbers(html: str) -> dict:
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, "lxml")
     text = soup.get_text(" ", strip=True)
     out = {}
-    for label in LABELS:
-        m = re.search(rf"{label}\s+([0-9 ][0-9 ]+)", text)
+    for label, label_re in LABEL_RES.items():
+        m = label_re.search(text)
         if not m:
             continue
-        num = int(m.group(1).replace(" ", ""))
+        num = int(m.group(1).translate(_SPACE_STRIP))
         out[LABELS[label]] = num
     missing = [k for k in LABELS.values() if k not in out]
     if missing:
         raise ValueError(f"Saknar etiketter: {missing}. Strukturen kan ha ändrats.")
     return out
 
+HEADER = ["Datum", "Konverteringar", "Varumärken", "Diff"]
+
 def ensure_workbook(path: Path) -> Workbook:
-    if path.exists():
-        wb = load_workbook(path)
-    else:
-        wb = Workbook()
-        ws = wb.active
-        ws.title = SHEET_NAME
-        ws.append(["Datum", "Konverteringar", "Varumärken", "Diff"])
+    wb = load_workbook(path)
     if SHEET_NAME not in wb.sheetnames:
         ws = wb.create_sheet(SHEET_NAME)
-        ws.append(["Datum", "Konverteringar", "Varumärken", "Diff"])
+        ws.append(HEADER)
     return wb
 
 def append_row_xlsx(path: Path, row: dict):
-    wb = ensure_workbook(path)
-    ws = wb[SHEET_NAME]
-
-    # kolla om Datum redan finns
     Datum_s = row["Datum"]
-    for r in ws.iter_rows(min_row=2, values_only=True):
-        if r and r[0] == Datum_s:
-            return None
 
-    # hämta förra radens Konverteringar
+    # ny fil: skapa i write_only-läge, ingen tidigare rad att räkna diff mot
+    if not path.exists():
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(SHEET_NAME)
+        ws.append(HEADER)
+        ws.append([Datum_s, row["Konverteringar"], row["Varumärken"], None])
+        wb.save(path)
+        return (Datum_s, row["Konverteringar"], row["Varumärken"], None)
+
+    # en enda inläsning: ett pass över kolumn A–B ger både dubblettkoll och sista radens Konverteringar
+    wb = ensure_workbook(path)
+    ws = wb[SHEET_NAME]
     prev_conv = None
-    if ws.max_row > 1:
-        prev_row = ws[ws.max_row]   # sista raden
-        prev_conv = prev_row[1].value  # kolumn B (Konverteringar)
+    for r in ws.iter_rows(min_row=2, max_col=2, values_only=True):
+        if r[0] == Datum_s:
+            return None
+        prev_conv = r[1]
 
     diff = None
     if prev_conv is not None:
@@ -0,0 +1,148 @@
+# scripts/common/adtraction.py
+"""
+Gemensamma hjälpare för adtraction_epc_*-skripten.
+- Tal/valuta: to_float, symbol → ISO, "kr" per land
+- Playwright: blockering av onödiga resurser
+- JS som läser programtabellen (table#data) i ett anrop per sida
+- Landsbyte + listladdning under gemensamt sessionslås, därefter paginering av EPC-texter
+"""
+import asyncio
+import re
+from typing import Callable, Optional, Tuple
+
+from playwright.async_api import TimeoutError as PWTimeout
+
+PROGRAMS_HOME = "https://secure.adtraction.com/partner/programs.htm"
+PROGRAMS_LIST = "https://secure.adtraction.com/partner/listadvertprograms.htm"
+
+# resurser som inte behövs för att läsa tabellen – avbryts i varje context
+BLOCKED_RESOURCES = {"image", "font", "media", "stylesheet"}
+
+KR_BY_CC = {"SE": "SEK", "DK": "DKK", "NO": "NOK"}
+SYMBOL_MAP = {"€": "EUR", "$": "USD", "£": "GBP", "₽": "RUB", "₺": "TRY"}
+
+_FLOAT_TABLE = str.maketrans({"\xa0": None, "\u202f": None, " ": None, ",": "."})
+
+def to_float(s: str):
+    try:
+        return float(s.translate(_FLOAT_TABLE))
+    except ValueError:
+        return None
+
+async def block_assets(route):
+    if route.request.resource_type in BLOCKED_RESOURCES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+# EPC-texten per rad (null där cellen saknas); idx = EPC-kolumnens index eller null för fallback-cellen
+EPC_TEXTS_JS = """
+(rows, idx) => rows.map(r => {
+  const c = idx !== null
+    ? r.querySelector(`td:nth-child(${idx + 1})`)
+    : r.querySelector("td.visible-lg[align='right']");
+  return c ? c.textContent.trim() : null;
+})
+"""
+
+EPC_HEADER_IDX_JS = """
+() => {
+  const i = Array.from(document.querySelectorAll("table#data thead th"))
+    .findIndex(th => th.textContent.trim().toLowerCase() === "epc");
+  return i < 0 ? null : i;
+}
+"""
+
+# klickar aktiv "nästa"-knapp om den finns; false = sista sidan
+NEXT_PAGE_JS = """
+() => {
+  const b = document.querySelector("a.paginate_button.next:not(.disabled)");
+  if (!b) return false;
+  b.click();
+  return true;
+}
+"""
+
+# DataTables info, t.ex. "Visar 0 till 0 av totalt 0 rader" / "Showing 0 to 0 of 0 entries"
+DATA_INFO_TOTAL_RE = re.compile(r"\b(?:av|of)\s+(?:totalt\s+)?(\d+)", re.I)
+
+async def open_country_list(page, cid_country: int, cid_category: int) -> bool:
+    """Sätt landet i serversessionen och öppna kategorilistan. False = ingen tabell."""
+    # 1) Sätt landet i serversessionen
+    await page.goto(f"{PROGRAMS_HOME}?cid={cid_country}&asonly=false", wait_until="domcontentloaded")
+    try:
+        await page.wait_for_selector("body", timeout=8000)
+    except PWTimeout:
+        return False  # ge upp tyst
+
+    # 2) Gå till kategorilistan (utan cid – landet är satt)
+    async def open_list() -> bool:
+        await page.goto(f"{PROGRAMS_LIST}?cId={cid_category}&asonly=false", wait_until="domcontentloaded")
+        try:
+            await page.wait_for_selector("table#data", timeout=6000)
+        except PWTimeout:
+            return False
+        try:
+            await page.wait_for_selector("table#data thead th, table#data tbody tr", timeout=4000)
+        except PWTimeout:
+            pass  # behandla som tom
+        return True
+
+    if await open_list():
+        return True
+    await page.goto(f"{PROGRAMS_HOME}?cid={cid_country}&asonly=false", wait_until="domcontentloaded")
+    return await open_list()
+
+async def scrape_category_country(
+    page,
+    cid_country: int,
+    cid_category: int,
+    session_lock: asyncio.Lock,
+    parse_cell: Callable[[str], Tuple[Optional[float], Optional[str]]],
+    skip_empty: bool = False,
+) -> list[tuple[float, str]]:
+    """
+    Sätt land → öppna kategorilistan → läs EPC via thead-index; parse_cell ger (värde, valuta).
+    Alla sidor delar serversessionen (och därmed valt land), så landsbyte + listladdning
+    körs under session_lock; när tabellen väl finns i sidan pagineras den utan servern.
+    skip_empty=True läser #data_info och hoppar över pagineringen när listan har 0 rader.
+    Om tabell saknas (inga annonsörer) returneras tom lista.
+    """
+    results: list[tuple[float, str]] = []
+
+    async with session_lock:
+        if not await open_country_list(page, cid_country, cid_category):
+            return results
+
+    if skip_empty:
+        info = await page.evaluate("() => document.querySelector('#data_info')?.textContent || ''")
+        m = DATA_INFO_TOTAL_RE.search(info)
+        if m and int(m.group(1)) == 0:
+            return results
+
+    # hitta EPC-kolumnen om headers finns; annars fallback (null)
+    epc_idx = await page.evaluate(EPC_HEADER_IDX_JS)
+
+    while True:
+        # alla EPC-texter på sidan i ett enda anrop (null där cellen saknas)
+        texts = await page.eval_on_selector_all("table#data tbody tr", EPC_TEXTS_JS, epc_idx)
+        if not texts:
+            break
+
+        for epc_text in texts:
+            if epc_text is None:
+                continue
+            v, cur = parse_cell(epc_text)
+            if v is not None and cur is not None:
+                results.append((v, cur))
+
+        # endast en aktiv "nästa"-knapp matchar; saknas den är vi på sista sidan
+        if not await page.evaluate(NEXT_PAGE_JS):
+            break
+        await page.wait_for_timeout(400)
+        try:
+            await page.wait_for_selector("table#data tbody tr", timeout=8000)
+        except PWTimeout:
+            break
+
+    return results
@@ -0,0 +1,328 @@
+# scripts/common/newegg.py
+"""
+Gemensam Newegg-rankning för fractal_*-skripten.
+- Hämtar kategorisidor (Best Selling) med httpx, Playwright som reserv vid bot-spärr
+- Varje skript anger URL, varianter och hur en sidas korttexter matchas (NeweggTarget)
+- Placering = global position bland icke-sponsrade kort, över sidor
+"""
+import os, re, sys, json, time, atexit, random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import httpx
+from bs4 import BeautifulSoup, SoupStrainer
+
+from scripts.common.paths import DATA_DIR, SOURCES_DIR
+
+XLSX_FILE = DATA_DIR / "data.xlsx"
+STATE_FILE = SOURCES_DIR / "newegg_state.json"  # sparade Newegg-cookies (Playwright storage_state-format)
+STATE_MAX_AGE_S = 24 * 3600  # yngre än så → hoppa över uppvärmningen
+USE_BROWSER = False  # True = Playwright direkt; annars httpx först och Playwright som reserv
+HEADLESS = False
+SLOW_MO_MS = 0  # >0 endast vid felsökning
+
+UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/127.0.0.0 Safari/537.36"
+HTTP_HEADERS = {
+    "User-Agent": UA,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+}
+
+# resurser/spårare som inte behövs för att läsa korten – avbryts i browser-vägen
+BLOCKED_RESOURCES = {"image", "font", "media", "stylesheet"}
+BLOCKED_HOSTS = ("googletagmanager", "doubleclick", "google-analytics", "facebook", "hotjar")
+
+# Newegg markerar sponsrade kort i DOM:en – filtreras bort innan texten läses
+SPONSORED_CSS = '.is-sponsored, [data-sponsored], :has([class*="sponsored" i])'
+
+SPONSORED_RE = re.compile(r"sponsored|advertisement")
+
+_TM_STRIP = str.maketrans({"®": " ", "™": " "})
+
+Items = List[Dict[str, str]]
+
+
+@dataclass
+class NeweggTarget:
+    """En kategorisida och de varianter som ska rankas på den."""
+    category_url: str
+    keys: List[str]
+    # korttexter för en sida → (variant, index på sidan) i sidordning
+    match_page: Callable[[List[str]], Iterable[Tuple[str, int]]]
+
+
+def page_url(category_url: str, pageno: int) -> str:
+    return category_url + (f"&Page={pageno}" if pageno > 1 else "")
+
+def fresh_state() -> Optional[Path]:
+    """STATE_FILE om den finns och är färsk nog, annars None."""
+    if STATE_FILE.exists() and time.time() - STATE_FILE.stat().st_mtime < STATE_MAX_AGE_S:
+        return STATE_FILE
+    return None
+
+def load_http_state(client: httpx.Client, state: Path) -> None:
+    for c in json.loads(state.read_text(encoding="utf-8")).get("cookies", []):
+        client.cookies.set(c["name"], c["value"], domain=c["domain"], path=c.get("path", "/"))
+
+def save_http_state(client: httpx.Client) -> None:
+    cookies = [
+        {
+            "name": c.name, "value": c.value, "domain": c.domain, "path": c.path,
+            "expires": c.expires or -1, "httpOnly": False, "secure": bool(c.secure), "sameSite": "Lax",
+        }
+        for c in client.cookies.jar
+    ]
+    STATE_FILE.write_text(json.dumps({"cookies": cookies, "origins": []}), encoding="utf-8")
+
+def looks_sponsored_text(txt: str) -> bool:
+    """Extra textkontroll; txt förväntas redan vara i gemener."""
+    return SPONSORED_RE.search(txt) is not None
+
+def dismiss_popups(page) -> None:
+    sels = [
+        'button:has-text("Accept All")', 'button:has-text("Accept")',
+        'button:has-text("Continue")', 'button[aria-label="Close"]',
+        '#truste-consent-button'
+    ]
+    for sel in sels:
+        try:
+            loc = page.locator(sel).first
+            if loc.is_visible():
+                loc.click(timeout=500)
+                time.sleep(0.2 + random.uniform(0, 0.3))
+        except Exception:
+            pass
+
+# En Chromium per process – delas av alla mål som körs i samma process
+_PW = None
+_BROWSER = None
+
+def get_browser():
+    """Starta den delade webbläsaren vid första anropet."""
+    global _PW, _BROWSER
+    if _BROWSER is None:
+        from playwright.sync_api import sync_playwright  # behövs bara när httpx-vägen inte räcker
+        _PW = sync_playwright().start()
+        _BROWSER = _PW.chromium.launch(
+            args=["--disable-blink-features=AutomationControlled"],
+            headless=HEADLESS,
+            slow_mo=SLOW_MO_MS,
+        )
+    return _BROWSER
+
+def close_browser() -> None:
+    global _PW, _BROWSER
+    if _BROWSER is not None:
+        _BROWSER.close()
+        _PW.stop()
+        _PW = _BROWSER = None
+
+atexit.register(close_browser)
+
+def block_assets(route) -> None:
+    req = route.request
+    if req.resource_type in BLOCKED_RESOURCES or any(h in req.url for h in BLOCKED_HOSTS):
+        route.abort()
+    else:
+        route.continue_()
+
+def build_browser_context(state: Optional[Path] = None):
+    ctx = get_browser().new_context(
+        viewport={"width": 1600, "height": 900}, user_agent=UA, locale="en-US",
+        storage_state=str(state) if state else None,
+    )
+    ctx.add_init_script('Object.defineProperty(navigator, "webdriver", {get: () => undefined})')
+    ctx.route("**/*", block_assets)
+    return ctx
+
+# Läser alla kort i ett anrop; sponsrade kort filtreras redan i sidan
+ITEMS_JS = """
+(sponsored) => {
+  let cells = document.querySelectorAll('div.item-cell');
+  if (!cells.length) cells = document.querySelectorAll('div.item-container, div.item-grid > div');
+  const out = [];
+  for (const c of cells) {
+    if (c.matches(sponsored)) continue;
+    const full = c.innerText || '';
+    const a = c.querySelector('a.item-title');
+    out.push({title: a ? a.innerText.trim() : '', full});
+  }
+  return out;
+}
+"""
+
+# Klart när (nästan) en full sida kort finns, eller när sidan laddat färdigt
+CARDS_READY_JS = "() => document.querySelectorAll('div.item-cell').length >= 90 || document.readyState === 'complete'"
+
+def collect_items_on_page(page) -> Items:
+    items: Items = []
+    for r in page.evaluate(ITEMS_JS, SPONSORED_CSS):
+        title = r["title"]
+        txt = (title + " " + r["full"]).translate(_TM_STRIP).lower()
+        if looks_sponsored_text(txt):
+            continue
+        items.append({"title": title, "fulltext": txt})
+    return items
+
+ITEM_CELLS = SoupStrainer("div", class_="item-cell")
+
+def parse_items_html(html: str) -> Items:
+    """Samma extraktion som collect_items_on_page, men på rå HTML (httpx-vägen)."""
+    # bygg bara träd för produktkorten; full parsning endast för äldre layout
+    tiles = BeautifulSoup(html, "lxml", parse_only=ITEM_CELLS).select("div.item-cell")
+    if not tiles:
+        tiles = BeautifulSoup(html, "lxml").select("div.item-container, div.item-grid > div")
+    items: Items = []
+    for t in tiles:
+        if t.css.match(SPONSORED_CSS):
+            continue
+        fulltext = t.get_text(" ", strip=True)
+        a = t.select_one("a.item-title")
+        title = a.get_text(strip=True) if a else ""
+        txt = (title + " " + fulltext).translate(_TM_STRIP).lower()
+        if looks_sponsored_text(txt):
+            continue
+        items.append({"title": title, "fulltext": txt})
+    return items
+
+# Löser så fort selektorn finns i DOM:en – händelsestyrt i stället för Playwrights pollning
+WAIT_SELECTOR_JS = """
+([sel, t]) => new Promise((res, rej) => {
+  if (document.querySelector(sel)) return res();
+  const o = new MutationObserver(() => {
+    if (document.querySelector(sel)) { o.disconnect(); res(); }
+  });
+  o.observe(document, {subtree: true, childList: true});
+  setTimeout(() => { o.disconnect(); rej(new Error('timeout: ' + sel)); }, t);
+})
+"""
+
+def wait_for_selector_mutation(page, selector: str, timeout_ms: int) -> None:
+    page.evaluate(WAIT_SELECTOR_JS, [selector, timeout_ms])
+
+def load_items_browser(page, url: str) -> Items:
+    # tillbaka så fort svaret är committat – korten väntas in nedan
+    page.goto(url, wait_until="commit", timeout=15000)
+    # produktgridden är den verkliga redo-signalen
+    try:
+        wait_for_selector_mutation(page, "div.item-cell a.item-title", 15000)
+    except Exception:
+        pass
+    dismiss_popups(page)
+    # trigga lazy-load och vänta på korten i stället för fasta pauser
+    page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+    try:
+        page.wait_for_function(CARDS_READY_JS, timeout=10000)
+    except Exception:
+        pass
+    page.evaluate("window.scrollTo(0, 0)")
+    return collect_items_on_page(page)
+
+def load_items_http(client: httpx.Client, url: str) -> Items:
+    r = client.get(url)
+    r.raise_for_status()
+    if "item-cell" not in r.text:
+        raise RuntimeError("inga produktkort i svaret (troligen bot-spärr)")
+    return parse_items_html(r.text)
+
+def find_global_ranks(target: NeweggTarget, load_items: Callable[[str], Items], max_pages: int = 10) -> Dict[str, Optional[int]]:
+    ranks: Dict[str, Optional[int]] = {k: None for k in target.keys}
+    missing = len(ranks)
+    global_pos = 0
+
+    for pageno in range(1, max_pages + 1):
+        items = load_items(page_url(target.category_url, pageno))
+        for key, idx in target.match_page([it["fulltext"] for it in items]):
+            if ranks[key] is None:
+                ranks[key] = global_pos + idx + 1
+                missing -= 1
+                if not missing:  # alla varianter hittade – inga fler sidor behövs
+                    return ranks
+        global_pos += len(items)
+
+        if len(items) < 10:  # sannolikt sista sidan
+            break
+
+    return ranks
+
+def find_ranks_http(target: NeweggTarget, max_pages: int = 10) -> Dict[str, Optional[int]]:
+    state = fresh_state()
+    # HTTP/2: uppvärmning och alla listsidor över samma TLS-anslutning
+    with httpx.Client(http2=True, headers=HTTP_HEADERS, follow_redirects=True, timeout=30) as client:
+        if state:
+            load_http_state(client, state)
+        else:
+            client.get("https://www.newegg.com/")  # värm upp cookies
+        ranks = find_global_ranks(target, lambda url: load_items_http(client, url), max_pages)
+        save_http_state(client)
+    return ranks
+
+def find_ranks_browser(target: NeweggTarget, max_pages: int = 10) -> Dict[str, Optional[int]]:
+    try:
+        from playwright_stealth import stealth_sync  # type: ignore
+    except ImportError:
+        stealth_sync = None  # type: ignore
+
+    state = fresh_state()
+    ctx = build_browser_context(state)
+    page = ctx.new_page()
+    if stealth_sync is not None:
+        try:
+            stealth_sync(page)
+        except Exception:
+            pass
+
+    # värm upp cookies
+    if state is None:
+        try:
+            page.goto("https://www.newegg.com/", wait_until="domcontentloaded", timeout=30000)
+            dismiss_popups(page)
+        except Exception:
+            pass
+
+    try:
+        ranks = find_global_ranks(target, lambda url: load_items_browser(page, url), max_pages)
+        ctx.storage_state(path=str(STATE_FILE))
+    finally:
+        ctx.close()  # webbläsaren stängs först vid processens slut
+    return ranks
+
+def find_ranks(target: NeweggTarget, max_pages: int = 10) -> Dict[str, Optional[int]]:
+    """httpx först; Playwright om httpx blockeras eller USE_BROWSER är satt."""
+    if not USE_BROWSER:
+        try:
+            return find_ranks_http(target, max_pages)
+        except (httpx.HTTPError, RuntimeError) as e:
+            sys.stderr.write(f"httpx misslyckades ({e}) – kör Playwright i stället.\n")
+    return find_ranks_browser(target, max_pages)
+
+def append_row(sheet_name: str, headers: List[str], row: list) -> None:
+    """Lägg till en rad i data.xlsx; skapar bladet och rättar rubrikraden vid behov."""
+    from openpyxl import Workbook, load_workbook  # endast vid skrivning
+
+    if os.path.exists(XLSX_FILE):
+        wb = load_workbook(XLSX_FILE)
+    else:
+        wb = Workbook()
+        wb.remove(wb.active)  # defaultbladet finns bara i en ny arbetsbok
+
+    if sheet_name not in wb.sheetnames:
+        ws = wb.create_sheet(sheet_name)
+        ws.append(headers)
+    else:
+        ws = wb[sheet_name]
+        # Säkerställ exakt headerordning/namn
+        existing = [cell.value for cell in next(ws.iter_rows(min_row=1, max_row=1))]
+        if existing != headers:
+            if ws.max_row == 1:
+                ws.delete_rows(1, 1)
+                ws.append(headers)
+            else:
+                # infoga ny header överst utan att paja historik
+                ws.insert_rows(1)
+                for c, h in enumerate(headers, 1):
+                    ws.cell(1, c, h)
+
+    ws.append(row)
+    wb.save(XLSX_FILE)
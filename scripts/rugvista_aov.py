@@ -1,13 +1,14 @@
 # rugvista_aov.py
+import asyncio
 from datetime import datetime
 import re, sys
-import time
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 TZ = ZoneInfo("Europe/Stockholm")
 
 import pandas as pd
-from openpyxl import load_workbook
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+from openpyxl import Workbook, load_workbook
+from playwright.async_api import async_playwright, TimeoutError as PWTimeout
 
 from pathlib import Path
 ROOT = Path(__file__).resolve().parents[1]
@@ -17,26 +18,39 @@ from scripts.common.paths import DATA_DIR
 
 
 BASE = "https://www.rugvista.se/c/mattor/bastsaljare"
+MAX_PAGES = 50
+PAGES_PER_WAVE = 4  # sidor som hämtas samtidigt efter sida 1
 UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
       "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
 
 PRICE_RE = re.compile(r"(\d[\d\s\u00A0]*)\s*kr", re.IGNORECASE)
+_NONDIGIT_RE = re.compile(r"\D+")
+_SPACE_STRIP = str.maketrans("", "", " \u00A0")
 
+# samma pristext återkommer ofta mellan korten
+@lru_cache(maxsize=4096)
 def parse_price(text: str):
     if not text:
         return None
     m = PRICE_RE.search(text)
     if not m:
-        digits = re.sub(r"[^\d]", "", text)
+        digits = _NONDIGIT_RE.sub("", text)
         return int(digits) if digits.isdigit() else None
-    digits = m.group(1).replace("\u00A0", "").replace(" ", "")
+    digits = m.group(1).translate(_SPACE_STRIP)
     return int(digits) if digits.isdigit() else None
 
-def get_prices_on_page(page) -> list[int]:
-    # scrolla ned lite för att trigga lazy-loading
-    for _ in range(3):
-        page.mouse.wheel(0, 2000)
-        time.sleep(0.3)
+SCROLL_JS = """
+async () => {
+  for (let y = 0; y < document.body.scrollHeight; y += 1500) {
+    window.scrollTo(0, y);
+    await new Promise(r => setTimeout(r, 80));
+  }
+}
+"""
+
+async def get_prices_on_page(page) -> list[int]:
+    # scrolla igenom sidan i ett anrop för att trigga lazy-loading
+    await page.evaluate(SCROLL_JS)
 
     js = r"""
     () => {
@@ -67,7 +81,7 @@ def get_prices_on_page(page) -> list[int]:
     }
     """
 
-    raw = page.evaluate(js)
+    raw = await page.evaluate(js)
     prices = []
     for t in raw:
         p = parse_price(t)
@@ -75,48 +89,55 @@ def get_prices_on_page(page) -> list[int]:
             prices.append(p)
     return prices
 
-def fetch_all_prices():
-    """Returnerar (alla_priser, priser_sida1)"""
-    prices_all = []
-    prices_page1 = []
-    with sync_playwright() as pw:
-        browser = pw.chromium.launch(headless=True, slow_mo=3000)
-        ctx = browser.new_context(user_agent=UA, locale="sv-SE")
-        page = ctx.new_page()
-
-        page_num = 1
-        while True:
-            url = BASE if page_num == 1 else f"{BASE}?page={page_num}"
-            try:
-                page.goto(url, wait_until="domcontentloaded", timeout=30000)
-            except PWTimeout:
-                break
+async def fetch_page(ctx, page_num: int, accept_cookies: bool = False) -> list[int]:
+    """Priser på en listningssida i en egen flik; tom lista = slut på listan (eller fel)."""
+    url = BASE if page_num == 1 else f"{BASE}?page={page_num}"
+    page = await ctx.new_page()
+    try:
+        try:
+            await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+        except PWTimeout:
+            return []
 
-            # Acceptera cookies (tyst om ingen banner)
+        # Acceptera cookies (tyst om ingen banner) – samtycket gäller sedan hela contexten
+        if accept_cookies:
             try:
-                page.wait_for_selector('button:has-text("Acceptera alla cookies")', timeout=8000)
-                page.locator('button:has-text("Acceptera alla cookies")').click()
+                await page.locator('button:has-text("Acceptera alla cookies")').click(timeout=8000)
             except Exception:
                 pass
 
-            try:
-                page.locator("#products-wrapper").wait_for(timeout=8000)
-            except PWTimeout:
-                break
-
-            prices = get_prices_on_page(page)
-            if len(prices) == 0:
-                break
-
-            if page_num == 1:
-                prices_page1 = prices[:]  # spara första sidan separat
-            prices_all.extend(prices)
+        try:
+            await page.locator("#products-wrapper").wait_for(timeout=8000)
+        except PWTimeout:
+            return []
 
-            page_num += 1
-            if page_num > 50:
-                break
+        return await get_prices_on_page(page)
+    finally:
+        await page.close()
 
-        browser.close()
+async def fetch_all_prices():
+    """Returnerar (alla_priser, priser_sida1)"""
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=True)
+        ctx = await browser.new_context(user_agent=UA, locale="sv-SE")
+
+        # sida 1 ensam – cookiebannern och Top-50 hör hit
+        prices_page1 = await fetch_page(ctx, 1, accept_cookies=True)
+        prices_all = prices_page1[:]
+
+        # resten i vågor om PAGES_PER_WAVE; första tomma sidan (i ordning) avslutar
+        page_num = 2
+        done = not prices_page1
+        while not done and page_num <= MAX_PAGES:
+            nums = range(page_num, min(page_num + PAGES_PER_WAVE, MAX_PAGES + 1))
+            for prices in await asyncio.gather(*(fetch_page(ctx, n) for n in nums)):
+                if not prices:
+                    done = True
+                    break
+                prices_all.extend(prices)
+            page_num += PAGES_PER_WAVE
+
+        await browser.close()
 
     return prices_all, prices_page1
 
@@ -127,9 +148,13 @@ def append_to_excel(timestamp_str: str, aov_int: int, aov_top50_int: int,
     cols = ["Datum", "RugVista 100", "RugVista 50"]
     row = {"Datum": timestamp_str, "RugVista 100": aov_int, "RugVista 50": aov_top50_int}
 
-    # Ny fil
+    # Ny fil – write-only strömmar raderna direkt till zip-filen
     if not p.exists():
-        pd.DataFrame([row], columns=cols).to_excel(path, index=False, sheet_name=sheet)
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(sheet)
+        ws.append(cols)
+        ws.append([timestamp_str, aov_int, aov_top50_int])
+        wb.save(path)
         return
 
     try:
@@ -151,10 +176,11 @@ def append_to_excel(timestamp_str: str, aov_int: int, aov_top50_int: int,
             ws[f"C{next_row}"].value = aov_top50_int
             wb.save(path)
         else:
-            with pd.ExcelWriter(path, engine="openpyxl", mode="a", if_sheet_exists="new") as w:
-                pd.DataFrame([row], columns=cols).to_excel(
-                    w, index=False, sheet_name=sheet
-                )
+            # arbetsboken är redan inläst – lägg till arket utan en andra läsning via pandas
+            ws = wb.create_sheet(sheet)
+            ws.append(cols)
+            ws.append([timestamp_str, aov_int, aov_top50_int])
+            wb.save(path)
     except Exception:
         # Fallback via pandas
         try:
@@ -167,7 +193,7 @@ def append_to_excel(timestamp_str: str, aov_int: int, aov_top50_int: int,
 
 
 def main():
-    prices_all, prices_p1 = fetch_all_prices()
+    prices_all, prices_p1 = asyncio.run(fetch_all_prices())
     total = len(prices_all)
     if total == 0:
         print("Inga priser hittades – kontrollera cookiebannern eller API-lösningen.")
@@ -45,11 +45,14 @@ def monthly_resample(df: pd.DataFrame) -> pd.DataFrame:
     return df.resample("MS").mean()
 
 def yoy_percent(series: pd.Series) -> pd.Series:
-    prev = series.shift(12)
-    return pd.Series(
-        np.where((prev.isna()) | (prev == 0), np.nan, (series - prev) / prev * 100.0),
-        index=series.index, dtype="float64"
-    )
+    # direkt på float64-bufferten – NaN där jämförelsemånad saknas eller = 0
+    cur = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    prev = np.full_like(cur, np.nan)
+    prev[12:] = cur[:-12]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = (cur - prev) / prev * 100.0
+    out[(prev == 0) | ~np.isfinite(prev)] = np.nan
+    return pd.Series(out, index=series.index)
 
 def fetch_trends(term: str) -> pd.DataFrame:
     py = TrendReq(hl=HL, tz=TZ)
@@ -71,21 +74,21 @@ def fetch_trends(term: str) -> pd.DataFrame:
 def main():
     monthly = fetch_trends(TERM)
 
-    # Heltal (ingen decimal)
-    base = monthly[[TERM]].round(0).astype("Int64")
-
-    # YoY % (avrundade till heltal)
-    yoy = yoy_percent(monthly[TERM]).round(0).astype("Int64")
-    yoy_df = pd.DataFrame({f"% YoY {TERM}": yoy}, index=monthly.index)
-
-    df_out = pd.concat([base, yoy_df], axis=1)
-    df_out.index = df_out.index.strftime("%Y-%m")
-    df_out.insert(0, "Månad", df_out.index)
-    df_out = df_out.reset_index(drop=True)
-
-    # Skriv till Excel, skapa fil om den inte finns
-    mode = "a" if OUT_FILE.exists() else "w"
-    with pd.ExcelWriter(OUT_FILE, engine="openpyxl", mode=mode, if_sheet_exists="replace") as writer:
+    # Heltal (ingen decimal) + YoY % avrundat till heltal – byggs i ett steg
+    vals = monthly[TERM].to_numpy(dtype=np.float64, na_value=np.nan)
+    yoy = yoy_percent(monthly[TERM]).to_numpy()
+    df_out = pd.DataFrame({
+        "Månad": monthly.index.strftime("%Y-%m"),
+        TERM: pd.array(np.rint(vals), dtype="Int64"),
+        f"% YoY {TERM}": pd.array(np.rint(yoy), dtype="Int64"),
+    })
+
+    # Skriv till Excel, skapa fil om den inte finns (xlsxwriter räcker för en ny fil)
+    if OUT_FILE.exists():
+        writer_kwargs = dict(engine="openpyxl", mode="a", if_sheet_exists="replace")
+    else:
+        writer_kwargs = dict(engine="xlsxwriter", mode="w")  # if_sheet_exists får EJ sättas här
+    with pd.ExcelWriter(OUT_FILE, **writer_kwargs) as writer:
         df_out.to_excel(writer, sheet_name=SHEET_NAME, index=False)
 
     print(f"Klart! Skrev {len(df_out)} rader till {OUT_FILE.name} ({SHEET_NAME}).")
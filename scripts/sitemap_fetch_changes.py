@@ -274,19 +274,13 @@ def ensure_output_sheet() -> None:
 
 def append_rows_to_sheet(rows: List[Dict[str, str]]) -> None:
     ensure_output_sheet()
-    df_new = pd.DataFrame(rows, columns=["Senast modifierad","Bolag","Typ av sajt","Länk","Sitemap","Status","Ändringar"])
-    try:
-        existing = pd.read_excel(OUTPUT_XLSX, sheet_name=OUTPUT_SHEET, dtype=str)
-    except Exception:
-        existing = pd.DataFrame(columns=df_new.columns)
-    combined = pd.concat([existing, df_new], ignore_index=True)
-    with pd.ExcelWriter(OUTPUT_XLSX, engine="openpyxl", mode="a", if_sheet_exists="overlay") as xw:
-        try:
-            ws = xw.book[OUTPUT_SHEET]
-            xw.book.remove(ws)
-        except KeyError:
-            pass
-        combined.to_excel(xw, index=False, sheet_name=OUTPUT_SHEET)
+    cols = ["Senast modifierad","Bolag","Typ av sajt","Länk","Sitemap","Status","Ändringar"]
+    # lägg till raderna direkt i bladet – befintlig historik läses/skrivs inte om via pandas
+    wb = load_workbook(OUTPUT_XLSX)
+    ws = wb[OUTPUT_SHEET]
+    for r in rows:
+        ws.append([r.get(c) for c in cols])
+    wb.save(OUTPUT_XLSX)
 
 def write_latest_sheet(df_latest: pd.DataFrame) -> None:
     ensure_output_sheet()
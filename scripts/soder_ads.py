@@ -66,10 +66,11 @@ def build_url(page_id: str, active: bool, base: dict) -> str:
     q = "&".join(f"{k}={v}" for k, v in params.items())
     return f"{BASE_URL}?{q}"
 
+# tusentalsavgränsare som tas bort i ett svep
+_INT_STRIP = str.maketrans("", "", "\u202f\u2009\u00a0 ,.")
+
 def normalize_int(s: str) -> int:
-    s = s.replace("\u202f","").replace("\u2009","").replace("\u00a0","").replace(" ","")
-    s = s.replace(",","").replace(".","")
-    return int(s)
+    return int(s.translate(_INT_STRIP))
 
 def parse_count(text: str) -> int | None:
     m = RESULT_RE.search(text or "")
@@ -39,17 +39,21 @@ HDRS = {
     "Accept-Language": "sv-SE,sv;q=0.9,en;q=0.8",
 }
 
+# en session för alla kategorisidor (återanvänd TCP/TLS-anslutning)
+SESSION = requests.Session()
+SESSION.headers.update(HDRS)
+
 # ---------- Hjälpfunktioner ----------
 def deaccent(s: str) -> str:
     return "".join(c for c in unicodedata.normalize("NFKD", (s or "").lower()) if not unicodedata.combining(c))
 
 def fetch_html(url: str) -> str:
-    r = requests.get(url, headers=HDRS, timeout=30)
+    r = SESSION.get(url, timeout=30)
     r.raise_for_status()
     return r.text
 
 def extract_products(html: str):
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, "lxml")
     items = []
     for card in soup.select("div.PT_Wrapper.product, div.product, article.product, li.product"):
         ls = card.select_one("div.lipscore-rating-small, .lipscore .lipscore-rating-small")
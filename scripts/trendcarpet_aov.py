@@ -42,16 +42,18 @@ def log(msg: str):
 
 # fånga heltalsdel + valfri decimaldel (komma eller punkt) före "kr"
 PRICE_RE = re.compile(r"(\d[\d\s\u00A0]*)(?:[.,]\d{2})?\s*kr", re.IGNORECASE)
+_NONDIGIT_RE = re.compile(r"\D+")
+_SPACE_STRIP = str.maketrans("", "", " \u00A0")
 
 def parse_price(text: str) -> int | None:
     if not text:
         return None
     m = PRICE_RE.search(text)
     if not m:
-        digits = re.sub(r"[^\d]", "", text)
+        digits = _NONDIGIT_RE.sub("", text)
         return int(digits) if digits.isdigit() else None
     # grupp 1 = heltalsdelen (t.ex. "499" eller "3 700") – ignorera ören helt
-    digits = m.group(1).replace("\u00A0", "").replace(" ", "")
+    digits = m.group(1).translate(_SPACE_STRIP)
     return int(digits) if digits.isdigit() else None
 
 def extract_lock_prices(page) -> list[int]: